@@ -0,0 +1,180 @@
+"""
+Fossil delta encoder, used to estimate what Centrifugo's delta compression
+sends for a given pair of payloads.
+
+Pure-Python port of the algorithm used by Centrifugo (github.com/centrifugal/
+fossil and fossil-delta-js). If the `fossil_delta` C extension is installed it
+is used instead — it produces the same format, much faster.
+"""
+
+try:
+    import fossil_delta
+except ImportError:
+    fossil_delta = None
+
+NHASH = 16
+_DIGITS = b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz~'
+
+
+class _RollingHash:
+    def __init__(self):
+        self.a = 0
+        self.b = 0
+        self.i = 0
+        self.z = [0] * NHASH
+
+    def init(self, data, pos):
+        a = b = 0
+        for i in range(NHASH):
+            x = data[pos + i]
+            a = (a + x) & 0xffff
+            b = (b + (NHASH - i) * x) & 0xffff
+            self.z[i] = x
+        self.a, self.b, self.i = a, b, 0
+
+    def next(self, c):
+        old = self.z[self.i]
+        self.z[self.i] = c
+        self.i = (self.i + 1) & (NHASH - 1)
+        self.a = (self.a - old + c) & 0xffff
+        self.b = (self.b - NHASH * old + self.a) & 0xffff
+
+    def value(self):
+        return self.a | (self.b << 16)
+
+
+def _put_int(out, v):
+    if v == 0:
+        out += b'0'
+        return
+    digits = bytearray()
+    while v > 0:
+        digits.append(_DIGITS[v & 0x3f])
+        v >>= 6
+    digits.reverse()
+    out += digits
+
+
+def _digit_count(v):
+    i = 1
+    x = 64
+    while v >= x:
+        i += 1
+        x <<= 6
+    return i
+
+
+def _checksum(data):
+    sums = [0, 0, 0, 0]
+    n = len(data) - len(data) % 4
+    for i in range(4):
+        sums[i] = sum(data[i:n:4])
+    total = (sums[3] + (sums[2] << 8) + (sums[1] << 16) + (sums[0] << 24)) & 0xffffffff
+    tail = data[n:]
+    for i, shift in enumerate((24, 16, 8)[:len(tail)]):
+        total = (total + (tail[i] << shift)) & 0xffffffff
+    return total
+
+
+def _create_delta_py(src, out):
+    delta = bytearray()
+    len_src = len(src)
+    len_out = len(out)
+
+    _put_int(delta, len_out)
+    delta += b'\n'
+
+    # Source too small to index: send the target as one literal.
+    if len_src <= NHASH:
+        _put_int(delta, len_out)
+        delta += b':'
+        delta += out
+        _put_int(delta, _checksum(out))
+        delta += b';'
+        return bytes(delta)
+
+    # Index every NHASH-aligned block of the source by its rolling hash.
+    n_hash = len_src // NHASH
+    collide = [-1] * n_hash
+    landmark = [-1] * n_hash
+    h = _RollingHash()
+    for i in range(0, len_src - NHASH, NHASH):
+        h.init(src, i)
+        hv = h.value() % n_hash
+        collide[i // NHASH] = landmark[hv]
+        landmark[hv] = i // NHASH
+
+    base = 0
+    while base + NHASH < len_out:
+        best_ofst = best_litsz = best_cnt = 0
+        h.init(out, base)
+        i = 0
+        while True:
+            limit = 250
+            i_block = landmark[h.value() % n_hash]
+            while i_block >= 0 and limit > 0:
+                limit -= 1
+                i_src = i_block * NHASH
+                # Extend the match forwards...
+                j = 0
+                x = i_src
+                y = base + i
+                while x < len_src and y < len_out and src[x] == out[y]:
+                    j += 1
+                    x += 1
+                    y += 1
+                j -= 1
+                # ...and backwards.
+                k = 1
+                while k < i_src and k <= i and src[i_src - k] == out[base + i - k]:
+                    k += 1
+                k -= 1
+
+                ofst = i_src - k
+                cnt = j + k + 1
+                litsz = i - k
+                sz = _digit_count(litsz) + _digit_count(cnt) + _digit_count(ofst) + 3
+                if cnt >= sz and cnt > best_cnt:
+                    best_cnt = cnt
+                    best_ofst = ofst
+                    best_litsz = litsz
+                i_block = collide[i_block]
+
+            if best_cnt > 0:
+                if best_litsz > 0:
+                    _put_int(delta, best_litsz)
+                    delta += b':'
+                    delta += out[base:base + best_litsz]
+                    base += best_litsz
+                base += best_cnt
+                _put_int(delta, best_cnt)
+                delta += b'@'
+                _put_int(delta, best_ofst)
+                delta += b','
+                break
+
+            if base + i + NHASH >= len_out:
+                _put_int(delta, len_out - base)
+                delta += b':'
+                delta += out[base:]
+                base = len_out
+                break
+
+            h.next(out[base + i + NHASH])
+            i += 1
+
+    if base < len_out:
+        _put_int(delta, len_out - base)
+        delta += b':'
+        delta += out[base:]
+
+    _put_int(delta, _checksum(out))
+    delta += b';'
+    return bytes(delta)
+
+
+def create_delta(src: bytes, out: bytes) -> bytes:
+    """Return the fossil delta that turns `src` into `out`."""
+    if fossil_delta is not None:
+        return fossil_delta.create_delta(src, out)
+    return _create_delta_py(src, out)
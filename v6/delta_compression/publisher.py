@@ -2,63 +2,123 @@
 """
 Publisher script that periodically sends data to Centrifugo using server API.
 The data has small incremental changes to demonstrate delta compression effectiveness.
+
+Publishes go over keep-alive connections (one requests.Session per worker
+thread) on a fixed-rate schedule: every PUBLISH_INTERVAL seconds each of
+CHANNELS channels gets one update, and the time spent on requests is taken
+out of the sleep rather than added to it.
 """
 
 import os
+import sys
 import time
 import json
 import random
+import argparse
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import fossil
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configuration from environment variables
 CENTRIFUGO_API_URL = os.getenv('CENTRIFUGO_API_URL', 'http://localhost:8000/api/publish')
 CENTRIFUGO_API_KEY = os.getenv('CENTRIFUGO_API_KEY', 'my_api_key')
 CHANNEL = 'updates:data'
-PUBLISH_INTERVAL = 0.1  # seconds
-
-# Sample data that will be gradually modified
-state = {
-    "timestamp": "",
-    "counter": 0,
-    "status": "active",
-    "metrics": {
-        "cpu": 0.0,
-        "memory": 0.0,
-        "disk": 0.0,
-        "network": {
-            "rx": 0,
-            "tx": 0
-        }
-    },
-    "events": [],
-    "config": {
-        "max_connections": 1000,
-        "timeout": 30,
-        "debug": False,
-        "features": {
-            "feature_a": True,
-            "feature_b": False,
-            "feature_c": True
-        }
-    }
+PUBLISH_INTERVAL = float(os.getenv('PUBLISH_INTERVAL', '0.1'))  # seconds
+# Number of channels to publish to: updates:data, updates:data_1, updates:data_2, ...
+CHANNELS = int(os.getenv('CHANNELS', '1'))
+# Worker threads, each with its own keep-alive connection.
+PUBLISHER_WORKERS = int(os.getenv('PUBLISHER_WORKERS', '8'))
+# auto | orjson | json – auto uses orjson when installed.
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'auto')
+
+HEADERS = {
+    'Content-Type': 'application/json',
+    'X-API-Key': CENTRIFUGO_API_KEY
 }
 
+_local = threading.local()
 
-def publish_to_centrifugo(data):
-    """Publish data to Centrifugo channel via HTTP API."""
-    headers = {
-        'Content-Type': 'application/json',
-        'X-API-Key': CENTRIFUGO_API_KEY
-    }
 
-    payload = {
-        'channel': CHANNEL,
-        'data': data
+def new_state():
+    """Sample data that will be gradually modified."""
+    return {
+        "timestamp": "",
+        "counter": 0,
+        "status": "active",
+        "metrics": {
+            "cpu": 0.0,
+            "memory": 0.0,
+            "disk": 0.0,
+            "network": {
+                "rx": 0,
+                "tx": 0
+            }
+        },
+        "events": [],
+        "config": {
+            "max_connections": 1000,
+            "timeout": 30,
+            "debug": False,
+            "features": {
+                "feature_a": True,
+                "feature_b": False,
+                "feature_c": True
+            }
+        }
     }
 
+
+def _stdlib_json_dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def select_json_encoder(name):
+    """Return a function that encodes an object to JSON bytes."""
+    if name == 'json':
+        return _stdlib_json_dumps
+    if name not in ('auto', 'orjson'):
+        raise ValueError(f"unknown JSON_ENCODER: {name!r}")
+    if orjson is None:
+        if name == 'orjson':
+            raise RuntimeError("JSON_ENCODER=orjson but orjson is not installed")
+        return _stdlib_json_dumps
+    return orjson.dumps
+
+
+json_dumps = select_json_encoder(JSON_ENCODER)
+
+
+def channel_name(i):
+    return CHANNEL if i == 0 else f'{CHANNEL}_{i}'
+
+
+def get_session():
+    """Return this thread's requests.Session, so connections are reused."""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+        session.headers.update(HEADERS)
+    return session
+
+
+def publish_to_centrifugo(channel, data, verbose=True):
+    """Publish data to Centrifugo channel via HTTP API.
+
+    `data` is the already encoded JSON of the publication, so the request body
+    is assembled around it instead of encoding the state a second time.
+    """
+    body = b'{"channel":' + json_dumps(channel) + b',"data":' + data + b'}'
+
     try:
-        response = requests.post(CENTRIFUGO_API_URL, json=payload, headers=headers)
+        response = get_session().post(CENTRIFUGO_API_URL, data=body)
         response.raise_for_status()
         result = response.json()
 
@@ -66,14 +126,15 @@ def publish_to_centrifugo(data):
             print(f"Error from Centrifugo: {result['error']}")
             return False
         else:
-            print(f"Published successfully (offset: {result.get('result', {}).get('offset', 'N/A')})")
+            if verbose:
+                print(f"Published successfully (offset: {result.get('result', {}).get('offset', 'N/A')})")
             return True
     except requests.exceptions.RequestException as e:
         print(f"Failed to publish: {e}")
         return False
 
 
-def update_state():
+def update_state(state):
     """Update state with small incremental changes."""
     state["timestamp"] = datetime.utcnow().isoformat() + "Z"
     state["counter"] += 1
@@ -102,29 +163,136 @@ def update_state():
         state["config"]["features"][feature] = not state["config"]["features"][feature]
 
 
+def resize_state(state, items):
+    """Add `items` extra entries to the state to grow the payload."""
+    state["items"] = [{"id": i, "name": f"item-{i}", "value": 0} for i in range(items)]
+
+
+def mutate_items(state, rate):
+    """Change the value of roughly `rate` of the extra entries."""
+    for item in state["items"]:
+        if random.random() < rate:
+            item["value"] = random.randint(0, 100000)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_benchmark(iterations, items_list, rates):
+    """Measure fossil delta size vs. full payload size for typical updates.
+
+    For every combination of payload size (extra items) and mutation rate,
+    runs `update_state` for `iterations` steps, encodes each payload the way
+    it would be published and computes its delta against the previous one.
+    """
+    print(f"Delta benchmark: {iterations} iterations per row"
+          f"{'' if fossil.fossil_delta else ' (pure-Python fossil encoder)'}")
+    print(f"{'items':>6} {'rate':>5} | {'full p50':>8} {'full p99':>8} | "
+          f"{'delta p50':>9} {'delta p90':>9} {'delta p99':>9} | "
+          f"{'ratio p50':>9} {'ratio p90':>9} {'total':>6} | {'cpu/delta':>10}")
+    print("-" * 112)
+
+    for items in items_list:
+        for rate in (rates if items else [0.0]):
+            state = new_state()
+            resize_state(state, items)
+            prev = None
+            full, delta, ratios, cpu = [], [], [], []
+            for _ in range(iterations):
+                update_state(state)
+                mutate_items(state, rate)
+                cur = json_dumps(state)
+                if prev is not None:
+                    started = time.process_time_ns()
+                    d = fossil.create_delta(prev, cur)
+                    cpu.append(time.process_time_ns() - started)
+                    full.append(len(cur))
+                    delta.append(len(d))
+                    ratios.append(len(d) / len(cur))
+                prev = cur
+            if not full:
+                continue
+            print(f"{items:>6} {rate:>5.2f} | {percentile(full, 0.5):>8} {percentile(full, 0.99):>8} | "
+                  f"{percentile(delta, 0.5):>9} {percentile(delta, 0.9):>9} {percentile(delta, 0.99):>9} | "
+                  f"{percentile(ratios, 0.5):>9.3f} {percentile(ratios, 0.9):>9.3f} "
+                  f"{sum(delta) / sum(full):>6.3f} | {sum(cpu) / len(cpu) / 1000:>8.1f}us")
+
+
 def main():
     print(f"Starting publisher...")
     print(f"Publishing to: {CENTRIFUGO_API_URL}")
-    print(f"Channel: {CHANNEL}")
+    print(f"Channels: {CHANNELS} (starting with {CHANNEL})")
     print(f"Interval: {PUBLISH_INTERVAL}s")
+    print(f"JSON encoder: {'orjson' if json_dumps is not _stdlib_json_dumps else 'json'}")
     print("-" * 60)
 
     # Wait a bit for Centrifugo to be ready
     time.sleep(3)
 
+    states = [new_state() for _ in range(CHANNELS)]
+    verbose = CHANNELS == 1
+    executor = ThreadPoolExecutor(max_workers=PUBLISHER_WORKERS)
+
+    next_tick = time.monotonic()
+    report_at = next_tick + 1
+    published = failed = 0
+
     while True:
-        update_state()
-        print(f"\n[{datetime.now().strftime('%H:%M:%S')}] Publishing update #{state['counter']}")
-        print(f"Data size: {len(json.dumps(state))} bytes")
+        for state in states:
+            update_state(state)
+        # Encode every state once; the same bytes are measured and sent.
+        encoded = [json_dumps(state) for state in states]
+        if verbose:
+            print(f"\n[{datetime.now().strftime('%H:%M:%S')}] Publishing update #{states[0]['counter']}")
+            print(f"Data size: {len(encoded[0])} bytes")
 
-        success = publish_to_centrifugo(state)
+        results = list(executor.map(
+            lambda i: publish_to_centrifugo(channel_name(i), encoded[i], verbose),
+            range(CHANNELS),
+        ))
+        ok = sum(results)
+        published += ok
+        failed += len(results) - ok
 
-        if not success:
+        if ok == 0:
             print("Retrying in 5 seconds...")
             time.sleep(5)
+            next_tick = time.monotonic()
+            continue
+
+        now = time.monotonic()
+        if not verbose and now >= report_at:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {published} published, {failed} failed in last second")
+            published = failed = 0
+            report_at = now + 1
+
+        # Fixed-rate schedule: sleep only for what is left of the interval.
+        # If a tick overran, start the next one right away instead of bursting.
+        next_tick += PUBLISH_INTERVAL
+        if next_tick > now:
+            time.sleep(next_tick - now)
         else:
-            time.sleep(PUBLISH_INTERVAL)
+            next_tick = now
+
+
+def parse_list(value, cast):
+    return [cast(v) for v in value.split(',') if v]
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bench', action='store_true',
+                        help='measure delta effectiveness locally instead of publishing')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--items', default='0,10,100,1000',
+                        help='comma-separated extra item counts (payload sizes)')
+    parser.add_argument('--rates', default='0.01,0.1,0.5',
+                        help='comma-separated fractions of items changed per update')
+    args = parser.parse_args()
+
+    if args.bench:
+        run_benchmark(args.iterations, parse_list(args.items, int), parse_list(args.rates, float))
+        sys.exit(0)
     main()
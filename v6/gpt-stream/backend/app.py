@@ -1,18 +1,39 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import AsyncOpenAI
 import httpx
 import os
 
-app = FastAPI()
+# OPENAI_BASE_URL points the client at any OpenAI-compatible server, e.g. the
+# local fake_openai.py used for testing without an API key.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 
 client = None
 if os.getenv("OPENAI_API_KEY"):
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=OPENAI_BASE_URL)
 
-CENTRIFUGO_HTTP_API_URL = "http://centrifugo:8000/api"
+CENTRIFUGO_HTTP_API_URL = os.getenv("CENTRIFUGO_HTTP_API_URL", "http://centrifugo:8000/api")
 CENTRIFUGO_HTTP_API_KEY = "secret"
 
+http_client: httpx.AsyncClient | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client
+    http_client = httpx.AsyncClient()
+    yield
+    await http_client.aclose()
+    if client:
+        await client.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
 class Command(BaseModel):
     text: str
     channel: str
@@ -38,14 +59,19 @@ async def handle_command(cmd: Command):
             channel,
             StreamMessage(text=f"⚠️ Error: OPENAI_API_KEY env is not set", done=True).model_dump()
         )
+        return
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        # Async streaming: waiting for the next chunk yields to the event
+        # loop, so one worker serves many completions at once.
+        response = await client.chat.completions.create(
+            model=OPENAI_MODEL,
             messages=[{"role": "user", "content": text}],
             stream=True,
         )
-        for chunk in response:
+        async for chunk in response:
+            if not chunk.choices:
+                continue
             token = chunk.choices[0].delta.content or ""
             if token:
                 await publish_message(
@@ -54,7 +80,7 @@ async def handle_command(cmd: Command):
                 )
         await publish_message(
             channel,
-            StreamMessage(text=token, done=True).model_dump()
+            StreamMessage(text="", done=True).model_dump()
         )
     except Exception as e:
         await publish_message(
@@ -74,6 +100,5 @@ async def publish_message(channel, stream_message):
         "Content-Type": "application/json"
     }
 
-    async with httpx.AsyncClient() as http_client:
-        await http_client.post(
-            f"{CENTRIFUGO_HTTP_API_URL}/publish", json=payload, headers=headers)
+    await http_client.post(
+        f"{CENTRIFUGO_HTTP_API_URL}/publish", json=payload, headers=headers)
@@ -0,0 +1,56 @@
+"""
+Fake OpenAI-compatible completion server for trying the backend without an
+API key. It streams a canned answer from POST /v1/chat/completions:
+
+    uvicorn fake_openai:app --port 5001
+
+and run the backend with OPENAI_BASE_URL=http://localhost:5001/v1 and any
+OPENAI_API_KEY. FAKE_TOKENS_PER_SECOND (default 20) sets the streaming speed.
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+FAKE_TOKENS_PER_SECOND = float(os.getenv("FAKE_TOKENS_PER_SECOND", "20"))
+
+ANSWER = (
+    "This is a fake streamed completion. Every word arrives as a separate "
+    "chunk, so you can watch tokens flow through Centrifugo to the browser "
+    "and run many completions at once without calling the real API."
+)
+
+app = FastAPI()
+
+
+def sse_chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    completion_id = "chatcmpl-" + uuid.uuid4().hex
+
+    async def stream():
+        yield sse_chunk(completion_id, model, {"role": "assistant", "content": ""})
+        for i, word in enumerate(ANSWER.split(" ")):
+            await asyncio.sleep(1 / FAKE_TOKENS_PER_SECOND)
+            yield sse_chunk(completion_id, model, {"content": word if i == 0 else " " + word})
+        yield sse_chunk(completion_id, model, {}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
@@ -18,18 +18,21 @@ There is no map broker and no broker-side state table in this pattern.
 from __future__ import annotations
 
 import asyncio
+import base64
 import json
 import logging
 import os
 import random
 import time
 import uuid
+from collections.abc import Callable
 from datetime import timedelta
 
-import asyncpg
 import httpx
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from pgpool import MeteredPool, create_pool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("pg_stream_broker_demo")
@@ -39,8 +42,25 @@ CENTRIFUGO_API_URL = os.environ.get("CENTRIFUGO_API_URL", "http://centrifugo:800
 
 ORDERS_CHANNEL = "orders:kitchen"
 
+# Serve getState from an in-memory snapshot advanced by our own commits.
+ORDERS_STATE_CACHE = os.environ.get("ORDERS_STATE_CACHE", "1") == "1"
+# How often (ms) a cached getState checks the stream top for publications
+# committed by other processes.
+ORDERS_STATE_CHECK_MS = float(os.environ.get("ORDERS_STATE_CHECK_MS", "1000"))
+# Max orders per getState page, and rows fetched per cursor round trip
+# when getState is streamed.
+ORDERS_PAGE_MAX = int(os.environ.get("ORDERS_PAGE_MAX", "1000"))
+ORDERS_STREAM_PREFETCH = int(os.environ.get("ORDERS_STREAM_PREFETCH", "500"))
+# Opt-in group commit: > 0 collects order mutations for this many ms and
+# commits them in one transaction.
+ORDERS_GROUP_COMMIT_MS = float(os.environ.get("ORDERS_GROUP_COMMIT_MS", "0"))
+# Finished (served/cancelled) orders are archived after this many seconds.
+ORDERS_ARCHIVE_AFTER_S = float(os.environ.get("ORDERS_ARCHIVE_AFTER_S", "600"))
+ORDERS_ARCHIVE_INTERVAL_S = float(os.environ.get("ORDERS_ARCHIVE_INTERVAL_S", "60"))
+ORDERS_ARCHIVE_BATCH = int(os.environ.get("ORDERS_ARCHIVE_BATCH", "500"))
+
 app = FastAPI()
-pool: asyncpg.Pool | None = None
+pool: MeteredPool | None = None
 http_client: httpx.AsyncClient | None = None
 
 
@@ -75,44 +95,360 @@ async def pg_stream_top_position(conn, channel: str) -> dict:
 
 
 # ---------------------------------------------------------------------------
-# Orders REST API
+# Orders state snapshot
 # ---------------------------------------------------------------------------
-@app.get("/api/orders/state")
-async def orders_get_state():
-    """Return all active orders + current stream position.
+def _order_data(row) -> dict:
+    items = row["items"] if isinstance(row["items"], list) else json.loads(row["items"])
+    return {
+        "tableNumber": row["table_number"],
+        "items": items,
+        "status": row["status"],
+        "notes": row["notes"],
+        "customerName": row["customer_name"],
+        "color": row["color"],
+        "createdAt": row["created_at"],
+        "updatedAt": row["updated_at"],
+    }
 
-    Position is read FIRST within a REPEATABLE READ transaction, then the
-    rows — this guarantees the returned position is a lower bound on any
-    data included in `entries`. Any publications committed after this
-    read will be delivered via stream catch-up to the SDK.
+
+ACTIVE_ORDERS_SQL = (
+    "SELECT id, table_number, items, status, notes, customer_name, "
+    "       color, created_at, updated_at "
+    "FROM orders WHERE status != 'cancelled'"
+)
+
+
+async def read_orders_state() -> tuple[dict, list[dict]]:
+    """Read stream position and active orders from one REPEATABLE READ snapshot.
+
+    Position is read FIRST, then the rows — this guarantees the returned
+    position is a lower bound on any data included in the entries.
     """
     async with pool.acquire() as conn:
         async with conn.transaction(isolation="repeatable_read"):
             pos = await pg_stream_top_position(conn, ORDERS_CHANNEL)
+            rows = await conn.fetch(ACTIVE_ORDERS_SQL + " ORDER BY created_at ASC, id ASC")
+    return pos, [{"key": row["id"], "data": _order_data(row)} for row in rows]
+
+
+# Paginated getState. Pages are keyed by (created_at, id). Every page returns
+# the position read before the FIRST page: later pages may already contain
+# changes committed after it, but the SDK replays everything after that
+# position and order publications are idempotent upserts/tombstones, so the
+# client still converges. The first page's position and the last row seen
+# travel to the next request inside an opaque cursor.
+def _encode_cursor(pos: dict, row) -> str:
+    raw = json.dumps([pos["offset"], pos["epoch"], row["created_at"], row["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[dict, int, str]:
+    """Parse a cursor from `_encode_cursor`; raises ValueError if malformed."""
+    value = json.loads(base64.urlsafe_b64decode(cursor))
+    if not isinstance(value, list) or len(value) != 4:
+        raise ValueError("cursor must encode a 4-item list")
+    offset, epoch, created_at, order_id = value
+    if not (isinstance(offset, int) and isinstance(epoch, str)
+            and isinstance(created_at, int) and isinstance(order_id, str)):
+        raise ValueError("cursor has wrong item types")
+    return {"offset": offset, "epoch": epoch}, created_at, order_id
+
+
+async def read_orders_page(limit: int, after: tuple[dict, int, str] | None) -> dict:
+    """Read one page of orders, the first one or the one after a decoded cursor."""
+    async with pool.acquire() as conn:
+        if after is None:
+            async with conn.transaction(isolation="repeatable_read"):
+                pos = await pg_stream_top_position(conn, ORDERS_CHANNEL)
+                rows = await conn.fetch(
+                    ACTIVE_ORDERS_SQL + " ORDER BY created_at ASC, id ASC LIMIT $1", limit,
+                )
+        else:
+            pos, created_at, order_id = after
             rows = await conn.fetch(
-                "SELECT id, table_number, items, status, notes, customer_name, "
-                "       color, created_at, updated_at "
-                "FROM orders WHERE status != 'cancelled' ORDER BY created_at ASC"
+                ACTIVE_ORDERS_SQL + " AND (created_at, id) > ($1, $2) "
+                "ORDER BY created_at ASC, id ASC LIMIT $3",
+                created_at, order_id, limit,
             )
+    return {
+        "entries": [{"key": row["id"], "data": _order_data(row)} for row in rows],
+        "offset": pos["offset"],
+        "epoch": pos["epoch"],
+        "cursor": _encode_cursor(pos, rows[-1]) if len(rows) == limit else None,
+    }
 
-    entries = []
-    for row in rows:
-        items = row["items"] if isinstance(row["items"], list) else json.loads(row["items"])
-        entries.append({
-            "key": row["id"],
-            "data": {
-                "tableNumber": row["table_number"],
-                "items": items,
-                "status": row["status"],
-                "notes": row["notes"],
-                "customerName": row["customer_name"],
-                "color": row["color"],
-                "createdAt": row["created_at"],
-                "updatedAt": row["updated_at"],
-            }
-        })
-
-    return JSONResponse({"entries": entries, "offset": pos["offset"], "epoch": pos["epoch"]})
+
+async def stream_orders_state(prefetch: int):
+    """Yield the getState JSON document row by row from a server-side cursor.
+
+    Position and epoch are written first so the document can be consumed
+    incrementally; memory use stays bounded by `prefetch` rows.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction(isolation="repeatable_read"):
+            pos = await pg_stream_top_position(conn, ORDERS_CHANNEL)
+            yield f'{{"offset":{pos["offset"]},"epoch":{json.dumps(pos["epoch"])},"entries":['
+            sep = ""
+            query = ACTIVE_ORDERS_SQL + " ORDER BY created_at ASC, id ASC"
+            async for row in conn.cursor(query, prefetch=prefetch):
+                yield sep + json.dumps({"key": row["id"], "data": _order_data(row)})
+                sep = ","
+            yield "]}"
+
+
+class OrdersSnapshot:
+    """In-memory getState response, kept current by this backend's own commits.
+
+    The snapshot is loaded once from Postgres and then advanced by applying
+    every publication this process commits to ORDERS_CHANNEL, strictly in
+    offset order. Publications that commit out of order wait in `pending`
+    until the gap before them closes.
+
+    Publications from other processes never reach `apply()`, so at most every
+    `check_interval` seconds getState also reads the stream top. A top ahead
+    of the snapshot opens a gap too (our own commit may simply not be applied
+    yet). If a gap stays open for longer than `max_gap` seconds, or the
+    stream epoch changes, the snapshot is dropped and reloaded. A snapshot is
+    therefore at most about `check_interval + max_gap` seconds behind other
+    writers. Concurrent getState calls share a single load.
+    """
+
+    def __init__(self, *, max_gap: float = 2.0, max_pending: int = 1000,
+                 check_interval: float = 1.0):
+        self.max_gap = max_gap
+        self.max_pending = max_pending
+        self.check_interval = check_interval
+        self.entries: dict[str, dict] | None = None
+        self.offset = 0
+        self.epoch = ""
+        self._pending: dict[int, tuple[str, dict]] = {}
+        self._gap_since: float | None = None
+        self._checked_at = 0.0
+        self._body: bytes | None = None
+        self._loading: asyncio.Future | None = None
+
+    async def get(self) -> bytes:
+        if self.entries is not None and time.monotonic() - self._checked_at > self.check_interval:
+            await self._check_top()
+        if self._gap_since is not None and time.monotonic() - self._gap_since > self.max_gap:
+            self.invalidate()
+        # A finished load may already be invalidated again by the time we
+        # resume (new epoch while draining, too many pending publications),
+        # so retry a few times and then read straight from Postgres.
+        for _ in range(3):
+            if self.entries is not None:
+                if self._body is None:
+                    self._body = self._encode(
+                        [{"key": k, "data": v} for k, v in self.entries.items()],
+                        self.offset, self.epoch,
+                    )
+                return self._body
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(self._load())
+            await asyncio.shield(self._loading)
+        pos, entries = await read_orders_state()
+        return self._encode(entries, pos["offset"], pos["epoch"])
+
+    async def _check_top(self):
+        # Stamped before the read so concurrent getState calls don't pile up
+        # top-position queries; they serve the current snapshot meanwhile.
+        self._checked_at = time.monotonic()
+        async with pool.acquire() as conn:
+            pos = await pg_stream_top_position(conn, ORDERS_CHANNEL)
+        if self.entries is None:
+            return
+        if pos["epoch"] != self.epoch:
+            self.invalidate()
+        elif pos["offset"] > self.offset and self._gap_since is None:
+            self._gap_since = time.monotonic()
+
+    @staticmethod
+    def _encode(entries: list[dict], offset: int, epoch: str) -> bytes:
+        return json.dumps(
+            {"entries": entries, "offset": offset, "epoch": epoch}, separators=(",", ":"),
+        ).encode()
+
+    async def _load(self):
+        try:
+            pos, entries = await read_orders_state()
+            self.entries = {e["key"]: e["data"] for e in entries}
+            self.offset, self.epoch = pos["offset"], pos["epoch"]
+            self._checked_at = time.monotonic()
+            self._body = None
+            self._pending = {o: p for o, p in self._pending.items() if o > self.offset}
+            self._drain()
+        finally:
+            self._loading = None
+
+    def apply(self, pos: dict, payload: dict):
+        """Apply a publication committed by this process at stream position `pos`."""
+        if self.entries is None:
+            # Mid-load publications may be newer than the loaded snapshot.
+            if self._loading is not None:
+                self._pending[pos["offset"]] = (pos["epoch"], payload)
+            return
+        if pos["offset"] <= self.offset:
+            return
+        self._pending[pos["offset"]] = (pos["epoch"], payload)
+        self._drain()
+        if len(self._pending) > self.max_pending:
+            self.invalidate()
+
+    def _drain(self):
+        while self.offset + 1 in self._pending:
+            epoch, payload = self._pending.pop(self.offset + 1)
+            if epoch != self.epoch:
+                self.invalidate()
+                return
+            if payload.get("removed"):
+                self.entries.pop(payload["key"], None)
+            else:
+                self.entries[payload["key"]] = payload["data"]
+            self.offset += 1
+            self._body = None
+        if not self._pending:
+            self._gap_since = None
+        elif self._gap_since is None:
+            self._gap_since = time.monotonic()
+
+    def invalidate(self):
+        self.entries = None
+        self._pending = {}
+        self._gap_since = None
+        self._body = None
+
+
+orders_snapshot = OrdersSnapshot(check_interval=ORDERS_STATE_CHECK_MS / 1000)
+
+
+# ---------------------------------------------------------------------------
+# Order mutations (optionally group-committed)
+# ---------------------------------------------------------------------------
+# A mutation is `async def mutate(conn)` that changes the orders table, calls
+# pg_stream_publish and returns (position, publication), or None when there
+# was nothing to change.
+class GroupCommitter:
+    """Commits mutations from concurrent requests in shared transactions.
+
+    Mutations submitted within `window` seconds (or until `max_batch` are
+    queued) run one after another in a single transaction, each inside its
+    own savepoint so a failing mutation does not take the others down.
+    One commit then covers the whole group; every caller's future resolves
+    only after that commit.
+
+    Only one group is committing at a time. Every mutation publishes to the
+    same stream and so locks its meta row: overlapping groups would just
+    queue on that lock, or deadlock when they touch the same orders in
+    opposite order. Mutations submitted while a group commits form the next
+    group, which starts as soon as the previous one is done.
+    """
+
+    def __init__(self, window: float, max_batch: int = 500):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: list[tuple[Callable, asyncio.Future]] = []
+        self._full = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+
+    async def submit(self, mutate: Callable):
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((mutate, fut))
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        elif len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await fut
+
+    async def _run(self):
+        try:
+            # The first group waits for the window (or a full batch); later
+            # groups have been accumulating while the previous one committed.
+            if len(self._pending) < self.max_batch:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+                await self._commit(batch)
+        finally:
+            self._worker = None
+
+    async def _commit(self, batch: list):
+        outcomes = []
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    for mutate, _ in batch:
+                        try:
+                            async with conn.transaction():
+                                outcomes.append((await mutate(conn), None))
+                        except Exception as e:
+                            outcomes.append((None, e))
+        except Exception as e:
+            logger.exception("group commit failed")
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), (result, error) in zip(batch, outcomes):
+            if fut.done():
+                continue
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+
+
+group_committer = GroupCommitter(ORDERS_GROUP_COMMIT_MS / 1000) if ORDERS_GROUP_COMMIT_MS > 0 else None
+
+
+async def commit_order_mutation(mutate: Callable) -> bool:
+    """Run and commit `mutate`; False if it found nothing to change."""
+    if group_committer is not None:
+        published = await group_committer.submit(mutate)
+    else:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                published = await mutate(conn)
+    if published is None:
+        return False
+    orders_snapshot.apply(*published)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Orders REST API
+# ---------------------------------------------------------------------------
+@app.get("/api/orders/state")
+async def orders_get_state(limit: int | None = None, cursor: str | None = None,
+                           stream: bool = False):
+    """Return active orders + a stream position that is a lower bound for them.
+
+    By default all orders are served from `orders_snapshot`, so a burst of
+    subscribes costs at most one Postgres scan. `limit` (+ `cursor` from the
+    previous page) pages through orders instead; `stream=true` streams the
+    full document from a server-side cursor. Any publications committed
+    after the returned position are delivered via stream catch-up.
+    """
+    if limit is not None or cursor is not None:
+        limit = max(1, min(limit or ORDERS_PAGE_MAX, ORDERS_PAGE_MAX))
+        after = None
+        if cursor is not None:
+            try:
+                after = _decode_cursor(cursor)
+            except ValueError:  # also covers bad base64, JSON and UTF-8
+                return JSONResponse({"error": "invalid cursor"}, status_code=400)
+        return JSONResponse(await read_orders_page(limit, after))
+    if stream:
+        return StreamingResponse(stream_orders_state(ORDERS_STREAM_PREFETCH),
+                                 media_type="application/json")
+    if not ORDERS_STATE_CACHE:
+        pos, entries = await read_orders_state()
+        return JSONResponse({"entries": entries, "offset": pos["offset"], "epoch": pos["epoch"]})
+    return Response(await orders_snapshot.get(), media_type="application/json")
 
 
 @app.post("/api/orders/create")
@@ -137,22 +473,20 @@ async def orders_create(request: Request):
         "updatedAt": now,
     }
 
-    async with pool.acquire() as conn:
-        async with conn.transaction():
-            await conn.execute(
-                """INSERT INTO orders (id, table_number, items, status, notes,
-                                       customer_name, color, created_at, updated_at)
-                   VALUES ($1, $2, $3::jsonb, $4, $5, $6, $7, $8, $8)""",
-                order_id, table_number, json.dumps(items), "pending",
-                notes, customer_name, color, now,
-            )
-            # Publication carries the key inside the payload. Clients apply
-            # it to their own in-memory map keyed by order_id.
-            await pg_stream_publish(conn, ORDERS_CHANNEL, {
-                "key": order_id,
-                "data": order_data,
-            })
+    async def mutate(conn):
+        await conn.execute(
+            """INSERT INTO orders (id, table_number, items, status, notes,
+                                   customer_name, color, created_at, updated_at)
+               VALUES ($1, $2, $3::jsonb, $4, $5, $6, $7, $8, $8)""",
+            order_id, table_number, json.dumps(items), "pending",
+            notes, customer_name, color, now,
+        )
+        # Publication carries the key inside the payload. Clients apply
+        # it to their own in-memory map keyed by order_id.
+        publication = {"key": order_id, "data": order_data}
+        return await pg_stream_publish(conn, ORDERS_CHANNEL, publication), publication
 
+    await commit_order_mutation(mutate)
     return JSONResponse({"orderId": order_id})
 
 
@@ -166,50 +500,43 @@ async def orders_update_status(request: Request):
     if new_status not in valid:
         return JSONResponse({"error": "invalid status"}, status_code=400)
 
-    async with pool.acquire() as conn:
-        async with conn.transaction():
-            row = await conn.fetchrow(
-                "SELECT id, table_number, items, status, notes, customer_name, "
-                "       color, created_at, updated_at "
-                "FROM orders WHERE id = $1 FOR UPDATE",
-                order_id,
-            )
-            if not row:
-                return JSONResponse({"error": "order not found"}, status_code=404)
+    async def mutate(conn):
+        row = await conn.fetchrow(
+            "SELECT id, table_number, items, status, notes, customer_name, "
+            "       color, created_at, updated_at "
+            "FROM orders WHERE id = $1 FOR UPDATE",
+            order_id,
+        )
+        if not row:
+            return None
 
-            now = int(time.time() * 1000)
-            await conn.execute(
-                "UPDATE orders SET status = $1, updated_at = $2 WHERE id = $3",
-                new_status, now, order_id,
-            )
+        now = int(time.time() * 1000)
+        await conn.execute(
+            "UPDATE orders SET status = $1, updated_at = $2 WHERE id = $3",
+            new_status, now, order_id,
+        )
 
-            items = row["items"] if isinstance(row["items"], list) else json.loads(row["items"])
-            order_data = {
-                "tableNumber": row["table_number"],
-                "items": items,
-                "status": new_status,
-                "notes": row["notes"],
-                "customerName": row["customer_name"],
-                "color": row["color"],
-                "createdAt": row["created_at"],
-                "updatedAt": now,
-            }
-
-            if new_status == "cancelled":
-                # Cancellation -> publish a tombstone. Clients drop the entry.
-                await pg_stream_publish(conn, ORDERS_CHANNEL, {
-                    "key": order_id,
-                    "removed": True,
-                })
-            else:
-                await pg_stream_publish(conn, ORDERS_CHANNEL, {
-                    "key": order_id,
-                    "data": order_data,
-                })
+        order_data = _order_data(row)
+        order_data["status"] = new_status
+        order_data["updatedAt"] = now
+
+        if new_status == "cancelled":
+            # Cancellation -> publish a tombstone. Clients drop the entry.
+            publication = {"key": order_id, "removed": True}
+        else:
+            publication = {"key": order_id, "data": order_data}
+        return await pg_stream_publish(conn, ORDERS_CHANNEL, publication), publication
 
+    if not await commit_order_mutation(mutate):
+        return JSONResponse({"error": "order not found"}, status_code=404)
     return JSONResponse({"success": True})
 
 
+@app.get("/api/metrics/pool")
+async def pool_metrics():
+    return JSONResponse(pool.metrics())
+
+
 # ---------------------------------------------------------------------------
 # Background task: demo order generator
 # ---------------------------------------------------------------------------
@@ -232,6 +559,7 @@ CUSTOMERS = ["Alice", "Bob", "Carlos", "Diana", "Emma", "Felix",
 
 async def orders_demo_task():
     await pool.execute("DELETE FROM orders")
+    orders_snapshot.invalidate()
     await asyncio.sleep(5)
 
     colors = ['#e91e63', '#9c27b0', '#3f51b5', '#00bcd4',
@@ -275,6 +603,63 @@ async def orders_demo_task():
             await asyncio.sleep(5)
 
 
+# ---------------------------------------------------------------------------
+# Background task: archive finished orders
+# ---------------------------------------------------------------------------
+# Served and cancelled orders older than ORDERS_ARCHIVE_AFTER_S move from
+# `orders` to `orders_archive` in batches, so the hot table (and getState)
+# only grows with active orders. Served orders are still part of the kitchen
+# state, so removing one publishes a tombstone in the same transaction.
+ARCHIVE_ORDERS_SQL = """
+WITH batch AS (
+    SELECT id FROM orders
+    WHERE status IN ('served', 'cancelled') AND updated_at < $1
+    ORDER BY updated_at
+    LIMIT $2
+    FOR UPDATE SKIP LOCKED
+), archived AS (
+    INSERT INTO orders_archive (id, table_number, items, status, notes,
+                                customer_name, color, created_at, updated_at,
+                                archived_at)
+    SELECT o.id, o.table_number, o.items, o.status, o.notes,
+           o.customer_name, o.color, o.created_at, o.updated_at, $3
+    FROM orders o JOIN batch USING (id)
+    RETURNING id
+)
+-- Only delete what was actually written to the archive.
+DELETE FROM orders WHERE id IN (SELECT id FROM archived)
+RETURNING id, status
+"""
+
+
+async def archive_finished_orders() -> int:
+    """Move one batch of finished orders to the archive; return its size."""
+    now = int(time.time() * 1000)
+    cutoff = now - int(ORDERS_ARCHIVE_AFTER_S * 1000)
+    published = []
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            rows = await conn.fetch(ARCHIVE_ORDERS_SQL, cutoff, ORDERS_ARCHIVE_BATCH, now)
+            for row in rows:
+                if row["status"] == "served":
+                    publication = {"key": row["id"], "removed": True}
+                    pos = await pg_stream_publish(conn, ORDERS_CHANNEL, publication)
+                    published.append((pos, publication))
+    for pos, publication in published:
+        orders_snapshot.apply(pos, publication)
+    return len(rows)
+
+
+async def orders_archive_task():
+    while True:
+        try:
+            await asyncio.sleep(ORDERS_ARCHIVE_INTERVAL_S)
+            while await archive_finished_orders() == ORDERS_ARCHIVE_BATCH:
+                pass
+        except Exception:
+            logger.exception("orders_archive_task error")
+
+
 # ---------------------------------------------------------------------------
 # Lifecycle
 # ---------------------------------------------------------------------------
@@ -284,7 +669,7 @@ async def startup():
 
     for attempt in range(30):
         try:
-            pool = await asyncpg.create_pool(DATABASE_URL, min_size=2, max_size=10)
+            pool = await create_pool(DATABASE_URL)
             break
         except Exception:
             logger.info("waiting for PostgreSQL... (%d)", attempt + 1)
@@ -307,8 +692,40 @@ async def startup():
             updated_at BIGINT NOT NULL DEFAULT 0
         )
     """)
+    # getState reads active orders in (created_at, id) order — keep an index
+    # of just those rows so it does not scan cancelled history.
+    await pool.execute("""
+        CREATE INDEX IF NOT EXISTS orders_active_created_idx
+            ON orders (created_at, id) WHERE status != 'cancelled'
+    """)
+    # Lets the archiver find finished orders without a full scan.
+    await pool.execute("""
+        CREATE INDEX IF NOT EXISTS orders_finished_updated_idx
+            ON orders (updated_at) WHERE status IN ('served', 'cancelled')
+    """)
+    await pool.execute("""
+        CREATE TABLE IF NOT EXISTS orders_archive (
+            -- Order ids are short and get reused over time, so archived rows
+            -- have their own key and every finished order is kept.
+            archive_id BIGSERIAL PRIMARY KEY,
+            id TEXT NOT NULL,
+            table_number INT NOT NULL,
+            items JSONB NOT NULL,
+            status TEXT NOT NULL,
+            notes TEXT NOT NULL,
+            customer_name TEXT NOT NULL,
+            color TEXT NOT NULL,
+            created_at BIGINT NOT NULL,
+            updated_at BIGINT NOT NULL,
+            archived_at BIGINT NOT NULL
+        )
+    """)
+    await pool.execute(
+        "CREATE INDEX IF NOT EXISTS orders_archive_id_idx ON orders_archive (id)"
+    )
 
     asyncio.create_task(orders_demo_task())
+    asyncio.create_task(orders_archive_task())
     logger.info("pg_stream_broker demo started")
 
 
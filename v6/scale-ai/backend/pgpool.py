@@ -0,0 +1,112 @@
+"""asyncpg pool factory with environment-driven sizing and saturation metrics.
+
+Pool settings are read from the environment (defaults in parentheses):
+
+    PG_POOL_MIN_SIZE (2)                      minimum open connections
+    PG_POOL_MAX_SIZE (10)                     maximum open connections
+    PG_STATEMENT_CACHE_SIZE (100)             prepared statements cached per connection
+    PG_MAX_INACTIVE_CONNECTION_LIFETIME (300) seconds before an idle connection is closed
+    PG_MAX_QUERIES (50000)                    queries before a connection is replaced
+
+The returned pool times every acquire(), so latency spent waiting for a free
+connection can be told apart from latency spent inside Postgres.
+
+The same file lives in the map_demo, pg_stream_broker and scale-ai backends
+(each example is built on its own) — keep the copies in sync.
+"""
+
+import os
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+# Upper bounds (ms) of the acquire-wait histogram buckets.
+ACQUIRE_WAIT_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class MeteredPool:
+    """asyncpg.Pool wrapper that records acquire wait time and waiter count."""
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self.waiting = 0
+        self._wait_counts = [0] * (len(ACQUIRE_WAIT_BUCKETS_MS) + 1)
+        self._wait_sum_ms = 0.0
+
+    @asynccontextmanager
+    async def acquire(self, *, timeout: float | None = None):
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            conn = await self.pool.acquire(timeout=timeout)
+        finally:
+            self.waiting -= 1
+        self._observe_wait((time.perf_counter() - start) * 1000)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    async def execute(self, query: str, *args, timeout: float | None = None) -> str:
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args, timeout=timeout)
+
+    async def fetch(self, query: str, *args, timeout: float | None = None) -> list:
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args, timeout: float | None = None):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args, column: int = 0, timeout: float | None = None):
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args, column=column, timeout=timeout)
+
+    async def close(self):
+        await self.pool.close()
+
+    def _observe_wait(self, wait_ms: float):
+        self._wait_sum_ms += wait_ms
+        for i, bound in enumerate(ACQUIRE_WAIT_BUCKETS_MS):
+            if wait_ms <= bound:
+                self._wait_counts[i] += 1
+                return
+        self._wait_counts[-1] += 1
+
+    def metrics(self) -> dict:
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        buckets = []
+        cumulative = 0
+        for bound, count in zip((*ACQUIRE_WAIT_BUCKETS_MS, "+Inf"), self._wait_counts):
+            cumulative += count
+            buckets.append({"le": bound, "count": cumulative})
+        return {
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "waiting": self.waiting,
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+            "acquire_wait_ms": {
+                "count": cumulative,
+                "sum": round(self._wait_sum_ms, 3),
+                "buckets": buckets,
+            },
+        }
+
+
+async def create_pool(dsn: str) -> MeteredPool:
+    pool = await asyncpg.create_pool(
+        dsn,
+        min_size=int(os.environ.get("PG_POOL_MIN_SIZE", "2")),
+        max_size=int(os.environ.get("PG_POOL_MAX_SIZE", "10")),
+        statement_cache_size=int(os.environ.get("PG_STATEMENT_CACHE_SIZE", "100")),
+        max_inactive_connection_lifetime=float(
+            os.environ.get("PG_MAX_INACTIVE_CONNECTION_LIFETIME", "300")
+        ),
+        max_queries=int(os.environ.get("PG_MAX_QUERIES", "50000")),
+    )
+    return MeteredPool(pool)